@@ -1,121 +1,229 @@
 import os
-import PyPDF2
+import fitz
+import numpy as np
 import pandas as pd
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import re
 from datetime import datetime
 import traceback
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+# Cap the pool so a large bills folder doesn't thrash the disk
+MAX_WORKERS = min(os.cpu_count() or 1, 8)
+
+# Flattens newlines and NULs to spaces in a single pass over each page
+_FLATTEN_TABLE = str.maketrans({'\n': ' ', '\0': ' '})
+
+# Built once per process and reused for every bill
+_TEXT_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=2000,
+    chunk_overlap=300,
+    length_function=len
+)
+
+CSV_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Bulk load tuning: rows per staged Parquet file and upload threads per PUT
+SNOWFLAKE_CHUNK_ROWS = 100_000
+SNOWFLAKE_PUT_PARALLEL = 8
+
+# New rows are loaded here, then swapped in for BILL_CHUNKS in one step
+SNOWFLAKE_STAGING_TABLE = 'BILL_CHUNKS_STAGING'
+
+# Maps each PDF to the SHA-1 of the bytes its CSV was built from
+MANIFEST_FILE = '_manifest.json'
+
+# Metadata patterns, compiled once per process
+_DATE_RE = re.compile(r'(\d{2}/\d{2}/\d{4}\s+\d{1,2}:\d{2}:\d{2}\s+(?:AM|PM)\s+WFP\d{3})')
+_SUBTITLE_RE = re.compile(r'(?:SUBTITLE|Subtitle):?\s*([^\n]+)')
+_SPONSOR_RE = re.compile(
+    r'(?:By\s(?:Representative|Senator)\s+|Sponsored by:\s*|SPONSOR(?:ED)?\s*(?:BY)?\s*:?\s*)'
+    r'([A-Z][A-Za-z\s,.-]+?)(?:\n|,|\s{2,})'
+)
+# Subtitles are searched in the first 1500 characters, sponsors in the first 1000
+_SUBTITLE_WINDOW = 1500
+_SPONSOR_WINDOW = 1000
+
+def _process_one_pdf(pdf_file, pdf_folder, output_folder, write_csv=True):
+    """Process a single PDF in a worker process"""
+    processor = LocalPDFProcessor(pdf_folder, output_folder)
+    return processor.process_pdf(pdf_file, write_csv=write_csv)
 
 class LocalPDFProcessor:
-    def __init__(self, pdf_folder, output_folder):
+    def __init__(self, pdf_folder, output_folder, snowflake_session=None):
         self.pdf_folder = pdf_folder
         self.output_folder = output_folder
+        # When a Snowpark session is given, chunks go straight to BILL_CHUNKS
+        # instead of being written to CSV and read back
+        self.snowflake_session = snowflake_session
         os.makedirs(self.output_folder, exist_ok=True)
 
     def read_pdf(self, pdf_path):
-        with open(pdf_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text().replace('\n', ' ').replace('\0', ' ')
+        text, _ = self.read_pdf_with_metadata(pdf_path)
         return text
 
     def extract_metadata_from_first_page(self, pdf_path):
-        with open(pdf_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            if len(reader.pages) > 0:
-                first_page_text = reader.pages[0].extract_text()
-                
-                # Extract date filed
-                bottom_text = first_page_text[-500:]
-                date_pattern = r'(\d{2}/\d{2}/\d{4}\s+\d{1,2}:\d{2}:\d{2}\s+(?:AM|PM)\s+WFP\d{3})'
-                date_match = re.search(date_pattern, bottom_text)
-                date_filed = None
-                if date_match:
-                    date_str = date_match.group(1)
-                    try:
-                        datetime_str = ' '.join(date_str.split()[:-1])
-                        date_filed = pd.to_datetime(datetime_str)
-                    except Exception as e:
-                        print(f"Error parsing date from {date_str}: {e}")
-
-                # Extract subtitle - looking for text after "SUBTITLE:" or similar patterns
-                subtitle_patterns = [
-                    r'SUBTITLE:?\s*([^\n]+)',
-                    r'Subtitle:?\s*([^\n]+)',
-                    r'SUBTITLE\s+(?:OF\s+)?(?:THE\s+)?(?:BILL)?:?\s*([^\n]+)'
-                ]
-                
-                bill_subtitle = None
-                for pattern in subtitle_patterns:
-                    subtitle_match = re.search(pattern, first_page_text[:1500])
-                    if subtitle_match:
-                        bill_subtitle = subtitle_match.group(1).strip()
-                        break
-
-                # Extract bill sponsor - looking for specific patterns
-                sponsor_patterns = [
-                    r'By(?:\sRepresentative|\sSenator)\s+([A-Z][A-Za-z\s,.-]+?)(?:\n|,|\s{2,})',
-                    r'Sponsored by:\s*([A-Z][A-Za-z\s,.-]+?)(?:\n|,|\s{2,})',
-                    r'SPONSOR(?:ED)?\s*(?:BY)?\s*:?\s*([A-Z][A-Za-z\s,.-]+?)(?:\n|,|\s{2,})'
-                ]
-                
-                bill_sponsor = None
-                for pattern in sponsor_patterns:
-                    sponsor_match = re.search(pattern, first_page_text[:1000])
-                    if sponsor_match:
-                        bill_sponsor = sponsor_match.group(1).strip()
-                        break
-
-                return {
-                    'date_filed': date_filed,
-                    'bill_subtitle': bill_subtitle,
-                    'bill_sponsor': bill_sponsor
-                }
+        _, metadata = self.read_pdf_with_metadata(pdf_path)
+        return metadata
+
+    def read_pdf_with_metadata(self, pdf_path):
+        """Read the full text and first-page metadata with a single open"""
+        with fitz.open(pdf_path) as doc:
+            parts = []
+            first_page_text = None
+            for page in doc:
+                page_text = page.get_text('text') or ''
+                if first_page_text is None:
+                    first_page_text = page_text
+                parts.append(page_text.translate(_FLATTEN_TABLE))
+        return ''.join(parts), self.extract_metadata_from_text(first_page_text)
+
+    def extract_metadata_from_text(self, first_page_text):
+        if not first_page_text:
+            return {
+                'date_filed': None,
+                'bill_subtitle': None,
+                'bill_sponsor': None
+            }
+
+        # Extract date filed
+        bottom_text = first_page_text[-500:]
+        date_match = _DATE_RE.search(bottom_text)
+        date_filed = None
+        if date_match:
+            date_str = date_match.group(1)
+            try:
+                datetime_str = ' '.join(date_str.split()[:-1])
+                date_filed = pd.to_datetime(datetime_str)
+            except Exception as e:
+                print(f"Error parsing date from {date_str}: {e}")
+
+        # Extract subtitle - looking for text after "SUBTITLE:" or "Subtitle:".
+        # Searched separately from the sponsor, which can share its line.
+        bill_subtitle = None
+        subtitle_match = _SUBTITLE_RE.search(first_page_text, 0, _SUBTITLE_WINDOW)
+        if subtitle_match:
+            bill_subtitle = subtitle_match.group(1).strip()
+
+        # Extract bill sponsor - "By Senator", "Sponsored by:" or "SPONSOR:"
+        bill_sponsor = None
+        sponsor_match = _SPONSOR_RE.search(first_page_text, 0, _SPONSOR_WINDOW)
+        if sponsor_match:
+            bill_sponsor = sponsor_match.group(1).strip()
+
         return {
-            'date_filed': None,
-            'bill_subtitle': None,
-            'bill_sponsor': None
+            'date_filed': date_filed,
+            'bill_subtitle': bill_subtitle,
+            'bill_sponsor': bill_sponsor
         }
 
     def chunk_text(self, text):
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=2000,
-            chunk_overlap=300,
-            length_function=len
-        )
-        return text_splitter.split_text(text)
+        return _TEXT_SPLITTER.split_text(text)
+
+    def process_pdf(self, pdf_file, write_csv=True):
+        pdf_path = os.path.join(self.pdf_folder, pdf_file)
+        text, metadata = self.read_pdf_with_metadata(pdf_path)
+        chunks = self.chunk_text(text)
+        if write_csv:
+            return self.save_chunks_to_csv(pdf_file, chunks, metadata)
+        return self.create_chunks_dataframe(pdf_file, chunks, metadata)
+
+    def file_digest(self, pdf_path):
+        with open(pdf_path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def load_manifest(self):
+        manifest_path = os.path.join(self.output_folder, MANIFEST_FILE)
+        try:
+            with open(manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self, manifest):
+        manifest_path = os.path.join(self.output_folder, MANIFEST_FILE)
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+    def is_unchanged(self, pdf_file, digest, manifest):
+        csv_file_path = os.path.join(self.output_folder, pdf_file.replace('.pdf', '.csv'))
+        return manifest.get(pdf_file) == digest and os.path.exists(csv_file_path)
 
     def process_pdfs(self):
-        for pdf_file in os.listdir(self.pdf_folder):
-            if pdf_file.endswith('.pdf'):
-                pdf_path = os.path.join(self.pdf_folder, pdf_file)
-                text = self.read_pdf(pdf_path)
-                chunks = self.chunk_text(text)
-                metadata = self.extract_metadata_from_first_page(pdf_path)
-                self.save_chunks_to_csv(pdf_file, chunks, metadata)
+        # scandir's entries carry the file type, so no extra stat per PDF
+        with os.scandir(self.pdf_folder) as entries:
+            pdf_paths = {
+                entry.name: entry.path
+                for entry in entries
+                if entry.is_file() and entry.name.endswith('.pdf')
+            }
+        pdf_files = list(pdf_paths)
+
+        # Skip PDFs whose CSV was already built from the same bytes. The
+        # Snowflake load replaces the whole table, so it always takes every PDF.
+        write_csv = self.snowflake_session is None
+        if write_csv:
+            manifest = self.load_manifest()
+            digests = {f: self.file_digest(pdf_paths[f]) for f in pdf_files}
+            unchanged = [f for f in pdf_files if self.is_unchanged(f, digests[f], manifest)]
+            if unchanged:
+                print(f"Skipping {len(unchanged)} unchanged PDFs")
+            pdf_files = [f for f in pdf_files if f not in unchanged]
+        if not pdf_files:
+            return []
+
+        # Parsing is CPU-bound, so spread the PDFs across processes
+        workers = min(MAX_WORKERS, len(pdf_files))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            frames = list(executor.map(
+                _process_one_pdf,
+                pdf_files,
+                [self.pdf_folder] * len(pdf_files),
+                [self.output_folder] * len(pdf_files),
+                [write_csv] * len(pdf_files)
+            ))
+
+        if write_csv:
+            for pdf_file, df in zip(pdf_files, frames):
+                if df is not None:
+                    manifest[pdf_file] = digests[pdf_file]
+            self.save_manifest(manifest)
+        else:
+            self.save_chunks_to_snowflake(frames)
+        return frames
+
+    def create_chunks_dataframe(self, pdf_file, chunks, metadata, timestamp_format=None):
+        timestamp = pd.Timestamp.now()
+        date_filed = metadata.get('date_filed')
+        # Both values are constant per bill, so format them once before broadcasting
+        if timestamp_format:
+            timestamp = timestamp.strftime(timestamp_format)
+            if date_filed is not None:
+                date_filed = date_filed.strftime(timestamp_format)
+
+        num_chunks = len(chunks)
+        return pd.DataFrame({
+            'chunk': chunks,
+            'chunk_index': np.arange(num_chunks),
+            'source_file': pdf_file,
+            'chunk_length': np.fromiter(map(len, chunks), dtype=np.int64, count=num_chunks),
+            'timestamp': timestamp,
+            'date_filed': date_filed,
+            'bill_subtitle': metadata.get('bill_subtitle'),
+            'bill_sponsor': metadata.get('bill_sponsor')
+        })
 
     def save_chunks_to_csv(self, pdf_file, chunks, metadata):
         try:
             print(f"Saving chunks for {pdf_file}...")
             csv_file_path = os.path.join(self.output_folder, pdf_file.replace('.pdf', '.csv'))
             
-            # Create DataFrame with chunks
-            df = pd.DataFrame({
-                'chunk': chunks,
-                'chunk_index': range(len(chunks)),
-                'source_file': pdf_file,
-                'chunk_length': [len(chunk) for chunk in chunks],
-                'timestamp': pd.Timestamp.now(),
-                'date_filed': metadata.get('date_filed'),
-                'bill_subtitle': metadata.get('bill_subtitle'),
-                'bill_sponsor': metadata.get('bill_sponsor')
-            })
-            
-            # Convert timestamps to proper format
-            df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
-            if df['date_filed'].notna().any():
-                df['date_filed'] = pd.to_datetime(df['date_filed']).dt.strftime('%Y-%m-%d %H:%M:%S')
+            # Create DataFrame with chunks and timestamps already formatted
+            df = self.create_chunks_dataframe(
+                pdf_file, chunks, metadata, timestamp_format=CSV_TIMESTAMP_FORMAT
+            )
             
             print(f"Created DataFrame with {len(chunks)} chunks")
             df.to_csv(csv_file_path, index=False)
@@ -127,6 +235,43 @@ class LocalPDFProcessor:
             print(f"Traceback: {traceback.format_exc()}")
             return None
 
+    def save_chunks_to_snowflake(self, frames):
+        frames = [df for df in frames if df is not None]
+        if not frames:
+            return
+        session = self.snowflake_session
+        try:
+            # One bulk load into an empty copy of BILL_CHUNKS, swapped in only
+            # once the COPY has succeeded. A failed parse or load leaves the
+            # live table untouched.
+            df = pd.concat(frames, ignore_index=True, copy=False)
+            # Bills without a filing date contribute None, which leaves the
+            # concatenated column as object dtype; normalise it to datetime64
+            df['date_filed'] = pd.to_datetime(df['date_filed'])
+            df['source_file'] = df['source_file'].str.upper()
+            print(f"Writing {len(df)} chunks to Snowflake...")
+            session.sql(f"CREATE OR REPLACE TABLE {SNOWFLAKE_STAGING_TABLE} LIKE BILL_CHUNKS").collect()
+            # The Cortex Search service keeps reading BILL_CHUNKS after the swap
+            session.sql(f"ALTER TABLE {SNOWFLAKE_STAGING_TABLE} SET CHANGE_TRACKING = TRUE").collect()
+            session.write_pandas(
+                df,
+                SNOWFLAKE_STAGING_TABLE,
+                chunk_size=SNOWFLAKE_CHUNK_ROWS,
+                parallel=SNOWFLAKE_PUT_PARALLEL,
+                auto_create_table=False,
+                use_logical_type=True
+            )
+            session.sql(f"ALTER TABLE BILL_CHUNKS SWAP WITH {SNOWFLAKE_STAGING_TABLE}").collect()
+            print(f"Successfully wrote {len(df)} chunks to Snowflake")
+        except Exception as e:
+            print(f"Error writing chunks to Snowflake: {str(e)}")
+            print(f"Error type: {type(e)}")
+            print(f"Traceback: {traceback.format_exc()}")
+            raise
+        finally:
+            # Holds the old rows after a swap, or a partial load after a failure
+            session.sql(f"DROP TABLE IF EXISTS {SNOWFLAKE_STAGING_TABLE}").collect()
+
 if __name__ == '__main__':
     # Example usage
     pdf_folder = 'bills'
@@ -1,13 +1,14 @@
 import os
 import streamlit as st
-import pandas as pd
 import traceback
 from dotenv import load_dotenv
-from snowflake.snowpark import Session
+from snowflake.snowpark import Session, Row
+from snowflake.core import Root
 from local_pdf_processor import LocalPDFProcessor
-import json
 import re
 import sys
+import time
+from collections import deque
 
 # Set page config at the very start
 st.set_page_config(
@@ -16,8 +17,8 @@ st.set_page_config(
     layout="wide"
 )
 
-# Custom CSS for better message formatting
-st.markdown("""
+# All custom CSS in one style block, emitted once per rerun
+APP_CSS = """
     <style>
     /* Add padding to message containers */
     .stChatMessage {
@@ -44,37 +45,66 @@ st.markdown("""
     a:hover {
         text-decoration: underline !important;
     }
+    
+    /* Set background color */
+    .stApp {
+        background-color: #E6E6FA;  /* Light purple color */
+    }
+    .stChatMessage {
+        background-color: white !important;
+    }
+    /* Style the chat input */
+    .stChatInput {
+        border-radius: 8px !important;
+        background-color: white !important;
+        margin-top: 20px !important;
+        margin-bottom: 20px !important;
+        padding: 10px !important;
+        box-shadow: 0 2px 6px rgba(0,0,0,0.1) !important;
+    }
+    /* Add some space after messages */
+    .stChatMessageContent {
+        margin-bottom: 15px !important;
+    }
+    
+    /* Main container header and stats */
+    .main-header {
+        text-align: center;
+        padding: 1rem;
+        margin-bottom: 2rem;
+    }
+    .subheader {
+        text-align: center;
+        color: #666;
+        margin-bottom: 2rem;
+    }
+    .stats-container {
+        text-align: center;
+        padding: 1rem;
+        background-color: #f8f9fa;
+        border-radius: 10px;
+        margin-bottom: 2rem;
+    }
+    .stats-grid {
+        display: flex;
+        justify-content: space-around;
+        flex-wrap: wrap;
+    }
+    .stat-label {
+        color: #666;
+        font-size: 0.9em;
+    }
+    .stat-value {
+        font-size: 1.8em;
+        font-weight: 600;
+    }
     </style>
-""", unsafe_allow_html=True)
+"""
+st.markdown(APP_CSS, unsafe_allow_html=True)
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Custom CSS to set background color
-st.markdown("""
-    <style>
-        .stApp {
-            background-color: #E6E6FA;  /* Light purple color */
-        }
-        .stChatMessage {
-            background-color: white !important;
-        }
-        /* Style the chat input */
-        .stChatInput {
-            border-radius: 8px !important;
-            background-color: white !important;
-            margin-top: 20px !important;
-            margin-bottom: 20px !important;
-            padding: 10px !important;
-            box-shadow: 0 2px 6px rgba(0,0,0,0.1) !important;
-        }
-        /* Add some space after messages */
-        .stChatMessageContent {
-            margin-bottom: 15px !important;
-        }
-    </style>
-""", unsafe_allow_html=True)
-
 # Define your connection parameters
 # These values are loaded from environment variables
 # Create a .env file with these variables (see .env.example)
@@ -111,50 +141,65 @@ root = None
 def get_snowflake_session():
     """Get cached Snowflake session"""
     try:
-        # Load environment variables
-        load_dotenv()
-        
-        # Get Snowflake credentials from environment variables
-        account = os.getenv('SNOWFLAKE_ACCOUNT')
-        user = os.getenv('SNOWFLAKE_USER')
-        password = os.getenv('SNOWFLAKE_PASSWORD')
-        role = os.getenv('SNOWFLAKE_ROLE')
-        warehouse = os.getenv('SNOWFLAKE_WAREHOUSE')
-        database = os.getenv('SNOWFLAKE_DATABASE')
-        schema = os.getenv('SNOWFLAKE_SCHEMA')
-        
-        if not all([account, user, password, role, warehouse, database, schema]):
-            st.error("Missing Snowflake credentials")
-            return None
-            
-        # Create Snowflake session
-        return Session.builder.configs({
-            "account": account,
-            "user": user,
-            "password": password,
-            "role": role,
-            "warehouse": warehouse,
-            "database": database,
-            "schema": schema
-        }).create()
+        # Credentials were loaded and validated at import
+        return Session.builder.configs(connection_parameters).create()
     
     except Exception as e:
         st.error(f"Snowflake Connection Error: {str(e)}")
         return None
 
+def get_live_session():
+    """Get the cached Snowflake session, reconnecting if it was lost"""
+    cached_session = get_snowflake_session()
+    # A failed connect is cached as None too, so retry that as well.
+    # is_closed() is a local flag check, not a round-trip.
+    if cached_session is None or cached_session.connection.is_closed():
+        get_snowflake_session.clear()
+        # Service handles are bound to the old session
+        get_cortex_search_service.clear()
+        cached_session = get_snowflake_session()
+    return cached_session
+
 def get_row_value(row, column):
-    """Safely get a value from a Snowflake row object"""
-    try:
-        # Try direct attribute access
-        return getattr(row, column, None)
-    except:
-        try:
-            # Try dictionary-style access
-            return row[column]
-        except:
-            return None
+    """Safely get a value from a Snowflake row object
+
+    For several columns of the same row, convert it once with row.as_dict() instead.
+    """
+    return getattr(row, column, None)
+
+@st.cache_resource
+def get_cortex_search_service(_session, service_name):
+    """Get cached handle to a Cortex Search service in the current schema"""
+    # Session reports quoted identifiers, e.g. "SNOW_PDF"; Root wants bare names
+    database = _session.get_current_database().strip('"')
+    schema = _session.get_current_schema().strip('"')
+    return Root(_session).databases[database].schemas[schema].cortex_search_services[service_name]
+
+@st.cache_data(ttl=300, max_entries=128)  # Cache for 5 minutes
+def run_search_query(_session, query_sql, query_params):
+    """Get cached rows for a search query and its bind parameters"""
+    return _session.sql(query_sql, params=query_params).collect()
+
+@st.cache_data(ttl=300, max_entries=128)  # Cache for 5 minutes
+def search_cortex_service(_session, service_name, query, limit):
+    """Get cached Cortex Search hits as rows with upper-case column names"""
+    service = get_cortex_search_service(_session, service_name)
+    response = service.search(
+        query=query,
+        columns=["chunk", "source_file", "chunk_index"],
+        limit=limit
+    )
+    return [Row(**{k.upper(): v for k, v in r.items()}) for r in response.results]
 
-@st.cache_data(ttl=3600)  # Cache for 1 hour
+def get_default_search_service():
+    """Name of the selected Cortex Search service, or the first one available"""
+    if st.session_state.selected_cortex_search_service:
+        return st.session_state.selected_cortex_search_service
+    if st.session_state.service_metadata:
+        return st.session_state.service_metadata[0]["name"]
+    return None
+
+@st.cache_data(ttl=3600, max_entries=1)  # Cache for 1 hour
 def get_service_metadata(_session):
     """Get cached service metadata"""
     if not _session:
@@ -174,48 +219,81 @@ def get_service_metadata(_session):
             st.error(f"Error getting service metadata: {str(e)}")
         return []
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_recent_bills(_session):
-    """Get cached recent bills"""
+# Bill statistics and the five most recent bills in a single round-trip.
+# Rows are tagged with KIND so they can be split back apart in Python.
+BILL_OVERVIEW_SQL = """
+    WITH stats AS (
+        SELECT
+            COUNT(DISTINCT "source_file") as total_bills,
+            MAX("date_filed") as latest_file_date
+        FROM BILL_CHUNKS
+    ),
+    recent AS (
+        SELECT DISTINCT "source_file", "bill_subtitle", "bill_sponsor", "date_filed"
+        FROM BILL_CHUNKS
+        ORDER BY "date_filed" DESC
+        LIMIT 5
+    )
+    SELECT 'stats' as kind, NULL as source_file, NULL as bill_subtitle, NULL as bill_sponsor,
+           latest_file_date as date_filed, total_bills
+    FROM stats
+    UNION ALL
+    SELECT 'recent', "source_file", "bill_subtitle", "bill_sponsor", "date_filed", NULL
+    FROM recent
+    ORDER BY kind, date_filed DESC
+"""
+
+@st.cache_data(ttl=300, max_entries=1)  # Cache for 5 minutes
+def get_bill_overview(_session):
+    """Get cached bill statistics and recent bills"""
+    overview = {'total_bills': 0, 'latest_file_date': None, 'recent_bills': []}
     if not _session:
-        return []
+        return overview
         
     try:
-        return _session.sql("""
-            SELECT DISTINCT "source_file", "bill_subtitle", "bill_sponsor", "date_filed"
-            FROM BILL_CHUNKS
-            ORDER BY "date_filed" DESC
-            LIMIT 5
-        """).collect()
+        for row in _session.sql(BILL_OVERVIEW_SQL).collect():
+            if get_row_value(row, 'KIND') == 'stats':
+                overview['total_bills'] = get_row_value(row, 'TOTAL_BILLS')
+                overview['latest_file_date'] = get_row_value(row, 'DATE_FILED')
+            else:
+                overview['recent_bills'].append(row)
+        return overview
     except Exception as e:
-        print(f"Error getting recent bills: {str(e)}")
+        print(f"Error getting bill overview: {str(e)}")
         if st.session_state.debug:
-            st.error(f"Error getting recent bills: {str(e)}")
-        return []
+            st.error(f"Error getting bill overview: {str(e)}")
+        return overview
+
+def get_recent_bills(_session):
+    """Get cached recent bills"""
+    return get_bill_overview(_session)['recent_bills']
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
 def get_bill_stats(_session):
     """Get cached bill statistics"""
-    if not _session:
-        return {'total_bills': 0, 'latest_file_date': None}
-        
-    try:
-        stats = _session.sql("""
-            SELECT 
-                COUNT(DISTINCT "source_file") as total_bills,
-                MAX("date_filed") as latest_file_date
-            FROM BILL_CHUNKS
-        """).collect()
-        if stats and len(stats) > 0:
-            return {
-                'total_bills': get_row_value(stats[0], 'TOTAL_BILLS'),
-                'latest_file_date': get_row_value(stats[0], 'LATEST_FILE_DATE')
-            }
-        return {'total_bills': 0, 'latest_file_date': None}
-    except Exception as e:
-        if st.session_state.debug:
-            st.error(f"Error getting bill stats: {str(e)}")
-        return {'total_bills': 0, 'latest_file_date': None}
+    overview = get_bill_overview(_session)
+    return {
+        'total_bills': overview['total_bills'],
+        'latest_file_date': overview['latest_file_date']
+    }
+
+@st.cache_data(ttl=600, max_entries=1)  # Cache for 10 minutes
+def get_row_count(_session):
+    """Get cached row count of BILL_CHUNKS"""
+    rows = _session.sql("""
+        SELECT COUNT(*) as row_count 
+        FROM BILL_CHUNKS;
+    """).collect()
+    return get_row_value(rows[0], 'ROW_COUNT')
+
+@st.cache_data(ttl=600, max_entries=1)  # Cache for 10 minutes
+def get_available_bills(_session):
+    """Get cached list of loaded bill files"""
+    rows = _session.sql("""
+        SELECT DISTINCT "source_file" AS SOURCE_FILE
+        FROM BILL_CHUNKS
+        ORDER BY SOURCE_FILE;
+    """).collect()
+    return [r.SOURCE_FILE for r in rows]
 
 def format_date(date):
     """Safely format a date with null check"""
@@ -244,63 +322,79 @@ def init_session_state():
         st.session_state.service_metadata = []
     if "selected_cortex_search_service" not in st.session_state:
         st.session_state.selected_cortex_search_service = None
+    if "chat_latency" not in st.session_state:
+        # Only the most recent answers' timings are kept
+        st.session_state.chat_latency = deque(maxlen=50)
+
+# Question routing patterns, compiled once at import
+# Senate and House bill numbers in a single scan; the prefix gives the type
+_BILL_NUMBER_RE = re.compile(r'\b(SB|Senate Bill|HB|House Bill)\s*(\d+)\b', re.IGNORECASE)
+_BILL_PREFIX_TYPES = {
+    'SB': 'SB',
+    'SENATE BILL': 'SB',
+    'HB': 'HB',
+    'HOUSE BILL': 'HB'
+}
+
+_BILL_TYPE_PATTERNS = [
+    # House Bills
+    (re.compile(r'(?:recent|latest|any|tell|show|about|summary).*(?:house bill|hb)s?', re.IGNORECASE), 'HB'),
+    (re.compile(r'(?:house bill|hb)s?.*(?:recent|latest|filed|new)', re.IGNORECASE), 'HB'),
+    # Senate Bills
+    (re.compile(r'(?:recent|latest|any|tell|show|about|summary).*(?:senate bill|sb)s?', re.IGNORECASE), 'SB'),
+    (re.compile(r'(?:senate bill|sb)s?.*(?:recent|latest|filed|new)', re.IGNORECASE), 'SB'),
+    # Fallback patterns
+    (re.compile(r'\b(?:house bill|hb)s?\b', re.IGNORECASE), 'HB'),
+    (re.compile(r'\b(?:senate bill|sb)s?\b', re.IGNORECASE), 'SB')
+]
+
+_SPONSOR_PATTERNS = [
+    re.compile(r'(?:bills? (?:by|from|sponsored by)|what (?:bills|else) (?:has|have|did))?\s*(?:senator[s]?\s+([a-zA-Z.\s-]+))', re.IGNORECASE),
+    re.compile(r'(?:what|any|other)\s+bills?\s+(?:by|from|sponsored by)\s+([a-zA-Z.\s-]+?)(?:\s+(?:sponsor|file|author)|[?.,]|$)', re.IGNORECASE)
+]
+
+# Bill details pulled out of retrieved chunks
+_SPONSOR_RE = re.compile(r'By:\s*(Senator[s]?\s+[^\\n]+)')
+_SUBTITLE_RE = re.compile(r'Subtitle\s*\n((?:[^\n]+\n?)+?)(?=\n\s*\n|BE IT ENACTED)')
+_DATE_RE = re.compile(r'(\d{2}/\d{2}/\d{4})')
+_SUMMARY_RE = re.compile(r'AN ACT\s+(.+?)(?=\n\s*\n\s*Subtitle|BE IT ENACTED)', re.DOTALL)
+_WHITESPACE_RE = re.compile(r'\s+')
+_QUESTION_RE = re.compile(r'<question>\s*(.*?)\s*</question>', re.DOTALL)
+_SPONSOR_TITLE_RE = re.compile(r'By:\s*(Senator|Representative)\s+(.*?)\s*\d')
 
 def query_cortex_search_service(query, columns=None, filter=None):
     """Query the cortex search service"""
     if columns is None:
         # For now, just get the essential columns since we'll extract other info from chunk
-        columns = ["'chunk'", "source_file", "chunk_index"]
+        columns = ["CHUNK", "SOURCE_FILE", "CHUNK_INDEX"]
     
     try:
-        # First, let's check what's in the database
-        check_sql = """
-            SELECT COUNT(*) as row_count 
-            FROM BILL_CHUNKS;
-        """
-        row_count = session.sql(check_sql).collect()
+        # Database overview for debugging only, served from cache when warm
         if st.session_state.debug:
-            st.sidebar.write("Total rows in BILL_CHUNKS:", get_row_value(row_count[0], 'ROW_COUNT'))
-        
-        try:
-            # Check what bills are available
-            check_sql = """
-                SELECT DISTINCT "source_file"
-                FROM BILL_CHUNKS
-                ORDER BY "source_file";
-            """
-            available_bills = session.sql(check_sql).collect()
-            # print("available_bills", available_bills)
-        except Exception as e:
-            print("error 127")
-            print(f"Error getting available bills: {str(e)}")
-            if st.session_state.debug:
+            try:
+                st.sidebar.write("Total rows in BILL_CHUNKS:", get_row_count(session))
+                st.sidebar.write("Available bills:", get_available_bills(session))
+            except Exception as e:
+                print(f"Error getting available bills: {str(e)}")
                 st.sidebar.write(f"Error getting available bills: {str(e)}")
-            return [], []
         
-        # Display available bills
-        if st.session_state.debug:
-            st.sidebar.write("Available bills:", [get_row_value(r, "source_file") for r in available_bills])
+        # Collapse whitespace so repeated questions share cache entries
+        query = _WHITESPACE_RE.sub(' ', query).strip()
         
-        # Build query
-        select_cols = ", ".join(columns)  # This ensures we get all needed columns
+        # Build query. User text is passed as bind parameters, never
+        # interpolated, so repeated question shapes reuse the same SQL text.
         where_clause = f"AND {filter}" if filter else ""
+        limit = int(st.session_state.num_retrieved_chunks)
+        query_params = None
+        results = None
         
         # Extract specific bill number from query first
-        bill_patterns = [
-            # Senate Bills
-            (r'\b(SB|sb|Senate Bill|senate bill)\s*(\d+)\b', 'SB'),
-            # House Bills
-            (r'\b(HB|hb|House Bill|house bill)\s*(\d+)\b', 'HB')
-        ]
-        
         bill_query = None
-        for pattern, btype in bill_patterns:
-            match = re.search(pattern, query, re.IGNORECASE)
-            if match:
-                prefix = match.group(1).upper()
-                number = match.group(2)
-                bill_query = f"{btype}{number}"
-                break
+        match = _BILL_NUMBER_RE.search(query)
+        if match:
+            btype = _BILL_PREFIX_TYPES[match.group(1).upper()]
+            number = match.group(2)
+            bill_query = f"{btype}{number}"
         
         if bill_query:
             if st.session_state.debug:
@@ -308,42 +402,31 @@ def query_cortex_search_service(query, columns=None, filter=None):
             
             # Debug: Show actual SQL query
             query_sql = f"""
-                SELECT b."chunk", b."source_file", b."chunk_index"
+                SELECT b."chunk" AS CHUNK, b."source_file" AS SOURCE_FILE, b."chunk_index" AS CHUNK_INDEX
                 FROM BILL_CHUNKS b
-                WHERE UPPER(b."source_file") = '{bill_query.upper()}.PDF'
+                WHERE UPPER(b."source_file") = ?
                 {where_clause}
                 ORDER BY b."chunk_index"
-                LIMIT {st.session_state.num_retrieved_chunks}
+                LIMIT {limit}
             """
+            query_params = [f"{bill_query}.PDF"]
             
             if st.session_state.debug:
                 st.sidebar.write("SQL Query:", query_sql)
                 # Check what's in the table for this bill
-                check_sql = f"""
+                check_sql = """
                     SELECT COUNT(*) as count
                     FROM BILL_CHUNKS
-                    WHERE "source_file" = '{bill_query}.PDF'
+                    WHERE "source_file" = ?
                 """
-                count_result = session.sql(check_sql).collect()
+                count_result = session.sql(check_sql, params=query_params).collect()
                 st.sidebar.write(f"Number of chunks found for {bill_query}.PDF:", get_row_value(count_result[0], 'COUNT'))
         
         else:
             # Check for general bill type queries
-            bill_type_patterns = [
-                # House Bills
-                (r'(?:recent|latest|any|tell|show|about|summary).*(?:house bill|hb)s?', 'HB'),
-                (r'(?:house bill|hb)s?.*(?:recent|latest|filed|new)', 'HB'),
-                # Senate Bills
-                (r'(?:recent|latest|any|tell|show|about|summary).*(?:senate bill|sb)s?', 'SB'),
-                (r'(?:senate bill|sb)s?.*(?:recent|latest|filed|new)', 'SB'),
-                # Fallback patterns
-                (r'\b(?:house bill|hb)s?\b', 'HB'),
-                (r'\b(?:senate bill|sb)s?\b', 'SB')
-            ]
-            
             bill_type = None
-            for pattern, btype in bill_type_patterns:
-                if re.search(pattern, query, re.IGNORECASE):
+            for pattern, btype in _BILL_TYPE_PATTERNS:
+                if pattern.search(query):
                     bill_type = btype
                     break
             
@@ -354,18 +437,14 @@ def query_cortex_search_service(query, columns=None, filter=None):
                 try:
                     # Get the most recent bill of this type
                     query_sql = f"""
-                        WITH RankedBills AS (
-                            SELECT DISTINCT "source_file",
-                                ROW_NUMBER() OVER (ORDER BY "source_file" DESC) as rn
-                            FROM BILL_CHUNKS
-                            WHERE "source_file" LIKE '{bill_type}%'
-                        )
-                        SELECT b."chunk", b."source_file", b."chunk_index"
-                        FROM BILL_CHUNKS b
-                        INNER JOIN RankedBills r ON r."source_file" = b."source_file"
-                        WHERE r.rn = 1
-                        ORDER BY b."chunk_index";
+                        SELECT "chunk" AS CHUNK, "source_file" AS SOURCE_FILE, "chunk_index" AS CHUNK_INDEX
+                        FROM BILL_CHUNKS
+                        WHERE "source_file" LIKE ?
+                        QUALIFY "source_file" = MAX("source_file") OVER ()
+                        ORDER BY "chunk_index"
+                        LIMIT {limit};
                     """
+                    query_params = [f"{bill_type}%"]
                 except Exception as e:
                     print("error 125")
                     print(f"Error getting most recent {bill_type} bill: {str(e)}")
@@ -375,14 +454,9 @@ def query_cortex_search_service(query, columns=None, filter=None):
             
             else:
                 # Check for sponsor query patterns
-                sponsor_patterns = [
-                    r'(?:bills? (?:by|from|sponsored by)|what (?:bills|else) (?:has|have|did))?\s*(?:senator[s]?\s+([a-zA-Z.\s-]+))',
-                    r'(?:what|any|other)\s+bills?\s+(?:by|from|sponsored by)\s+([a-zA-Z.\s-]+?)(?:\s+(?:sponsor|file|author)|[?.,]|$)'
-                ]
-                
                 sponsor_name = None
-                for pattern in sponsor_patterns:
-                    match = re.search(pattern, query, re.IGNORECASE)
+                for pattern in _SPONSOR_PATTERNS:
+                    match = pattern.search(query)
                     if match:
                         sponsor_name = match.group(1).strip()
                         break
@@ -391,38 +465,58 @@ def query_cortex_search_service(query, columns=None, filter=None):
                     if st.session_state.debug:
                         st.sidebar.write(f"Looking for bills by sponsor: {sponsor_name}")
                     
-                    # Get bills where first chunk contains the sponsor
+                    # Get bills where first chunk contains the sponsor, in a
+                    # single scan of BILL_CHUNKS. Every matching bill keeps its
+                    # first chunk, so the bill count below stays exact; at most
+                    # num_retrieved_chunks further chunks are added, a round
+                    # at a time (every bill's second chunk, then third, ...)
+                    # so one long bill can't crowd out the others
                     query_sql = f"""
-                        WITH RankedChunks AS (
-                            SELECT "chunk", "source_file", "chunk_index",
-                                   ROW_NUMBER() OVER (PARTITION BY "source_file" ORDER BY "chunk_index") as rn
+                        SELECT CHUNK, SOURCE_FILE, CHUNK_INDEX
+                        FROM (
+                            SELECT "chunk" AS CHUNK, "source_file" AS SOURCE_FILE, "chunk_index" AS CHUNK_INDEX,
+                                   ROW_NUMBER() OVER (PARTITION BY "source_file" ORDER BY "chunk_index") AS RN
                             FROM BILL_CHUNKS
+                            QUALIFY FIRST_VALUE("chunk") OVER (PARTITION BY "source_file" ORDER BY "chunk_index") LIKE '%By:%'
+                            AND FIRST_VALUE("chunk") OVER (PARTITION BY "source_file" ORDER BY "chunk_index") LIKE '%' || ? || '%'
                         )
-                        SELECT DISTINCT b."chunk", b."source_file", b."chunk_index"
-                        FROM BILL_CHUNKS b
-                        INNER JOIN RankedChunks r ON r."source_file" = b."source_file"
-                        WHERE r.rn = 1 
-                        AND r."chunk" LIKE '%By:%'
-                        AND r."chunk" LIKE '%{sponsor_name}%'
-                        ORDER BY b."source_file", b."chunk_index";
+                        QUALIFY RN = 1
+                        OR ROW_NUMBER() OVER (PARTITION BY RN > 1 ORDER BY RN, SOURCE_FILE) <= {limit}
+                        ORDER BY SOURCE_FILE, CHUNK_INDEX;
                     """
+                    query_params = [sponsor_name]
                     
                 else:
-                    # Use text search as last resort
+                    # Use the Cortex Search service index as last resort
+                    service_name = get_default_search_service() if not filter else None
+                    if service_name:
+                        try:
+                            # No hits falls through to CONTAINS as well
+                            results = search_cortex_service(session, service_name, query, limit) or None
+                        except Exception as e:
+                            print(f"Cortex Search error: {str(e)}")
+                            if st.session_state.debug:
+                                st.sidebar.write(f"Cortex Search error, falling back to CONTAINS: {str(e)}")
+                    
+                    # Plain text search when no service is available or it found nothing
                     query_sql = f"""
-                        SELECT b."chunk", b."source_file", b."chunk_index"
+                        SELECT b."chunk" AS CHUNK, b."source_file" AS SOURCE_FILE, b."chunk_index" AS CHUNK_INDEX
                         FROM BILL_CHUNKS b
-                        WHERE CONTAINS(b."chunk", '{query}')
+                        WHERE CONTAINS(b."chunk", ?)
                         {where_clause}
                         ORDER BY b."chunk_index"
-                        LIMIT {st.session_state.num_retrieved_chunks}
+                        LIMIT {limit}
                     """
+                    query_params = [query]
         
-        if st.session_state.debug:
-            st.sidebar.write("Query SQL:", query_sql)
-            st.sidebar.write("Selected columns:", columns)
-            
-        results = session.sql(query_sql).collect()
+        if results is None:
+            if st.session_state.debug:
+                st.sidebar.write("Query SQL:", query_sql)
+                st.sidebar.write("Selected columns:", columns)
+                
+            results = run_search_query(session, query_sql, query_params)
+        elif st.session_state.debug:
+            st.sidebar.write(f"Searched Cortex Search service: {service_name}")
         
         if not results:
             if st.session_state.debug:
@@ -444,19 +538,20 @@ def query_cortex_search_service(query, columns=None, filter=None):
         
         for r in results:
             try:
+                values = r.as_dict()
                 if st.session_state.debug:
                     st.sidebar.write("Processing result:")
                     for col in columns:
-                        st.sidebar.write(f"{col}: {get_row_value(r, col)}")
+                        st.sidebar.write(f"{col}: {values.get(col)}")
                 
                 # Extract bill info from chunk
-                chunk_text = get_row_value(r, "chunk")
+                chunk_text = values.get("CHUNK")
                 if not chunk_text:
                     if st.session_state.debug:
                         st.error("No chunk text found in result")
                     continue
                     
-                bill_name = get_row_value(r, 'source_file')
+                bill_name = values.get('SOURCE_FILE')
                 if bill_name:
                     bill_name = bill_name.replace('.pdf', '')
                 else:
@@ -526,26 +621,26 @@ def extract_bill_info_from_chunk(chunk):
     }
     
     # Extract sponsor
-    sponsor_match = re.search(r'By:\s*(Senator[s]?\s+[^\\n]+)', chunk)
+    sponsor_match = _SPONSOR_RE.search(chunk)
     if sponsor_match:
         info['sponsor'] = sponsor_match.group(1).strip()
     
     # Extract subtitle
-    subtitle_match = re.search(r'Subtitle\s*\n((?:[^\n]+\n?)+?)(?=\n\s*\n|BE IT ENACTED)', chunk)
+    subtitle_match = _SUBTITLE_RE.search(chunk)
     if subtitle_match:
         info['subtitle'] = subtitle_match.group(1).strip()
     
     # Extract date
-    date_match = re.search(r'(\d{2}/\d{2}/\d{4})', chunk)
+    date_match = _DATE_RE.search(chunk)
     if date_match:
         info['date_filed'] = date_match.group(1)
     
     # Extract summary (everything between "AN ACT" and "BE IT ENACTED")
-    summary_match = re.search(r'AN ACT\s+(.+?)(?=\n\s*\n\s*Subtitle|BE IT ENACTED)', chunk, re.DOTALL)
+    summary_match = _SUMMARY_RE.search(chunk)
     if summary_match:
         summary = summary_match.group(1).strip()
         # Clean up the summary
-        summary = re.sub(r'\s+', ' ', summary)  # Replace multiple whitespace with single space
+        summary = _WHITESPACE_RE.sub(' ', summary)  # Replace multiple whitespace with single space
         info['summary'] = summary
         
     return info
@@ -682,26 +777,29 @@ def extract_key_points(full_text):
 
     return key_points, len(section_info)
 
-def complete(prompt, session=None):
-    """Generate completion using Cortex Search Service."""
+def complete(prompt, session=None, results=None):
+    """Generate completion using Cortex Search Service.
+
+    Pass the results already retrieved by create_prompt to skip a second search.
+    """
     try:
         if session is None:
             session = get_snowflake_session()
             if session is None:
                 raise ValueError("Could not establish Snowflake session")
 
-        match = re.search(r'<question>\s*(.*?)\s*</question>', prompt, re.DOTALL)
-        if match:
-            search_query = match.group(1).strip()
-            search_query = search_query.replace("'", "''")
-        else:
-            search_query = prompt.replace("'", "''")
+        if results is None:
+            match = _QUESTION_RE.search(prompt)
+            if match:
+                search_query = match.group(1).strip()
+            else:
+                search_query = prompt
 
-        context, results = query_cortex_search_service(
-            search_query,
-            columns=["chunk", "source_file", "chunk_index"],
-            filter=None
-        )
+            context, results = query_cortex_search_service(
+                search_query,
+                columns=["CHUNK", "SOURCE_FILE", "CHUNK_INDEX"],
+                filter=None
+            )
 
         if not results:
             return "I don't have any relevant information about that in my current database."
@@ -723,14 +821,14 @@ def complete(prompt, session=None):
         bill_status_url = get_bill_status_url(bill_name)
 
         # Extract bill details
-        sponsor_match = re.search(r'By:\s*(Senator|Representative)\s+(.*?)\s*\d', full_text)
+        sponsor_match = _SPONSOR_TITLE_RE.search(full_text)
         sponsor_title = sponsor_match.group(1) if sponsor_match else "Legislator"
         sponsor_name = sponsor_match.group(2) if sponsor_match else "Unknown"
         
         # Extract and clean the title
         title = extract_bill_title(full_text)
         
-        date_match = re.search(r'(\d{2}/\d{2}/\d{4})', full_text)
+        date_match = _DATE_RE.search(full_text)
         filing_date = date_match.group(1) if date_match else "Unknown date"
 
         # Get page count and section information
@@ -831,6 +929,14 @@ def get_bill_status_url(bill_name):
     bill_name = bill_name.lower()
     return f"https://arkleg.state.ar.us/Bills/Detail?id={bill_name}&ddBienniumSession=2025%2F2025R&Search="
 
+# Chat messages rendered outside the "earlier messages" expander
+MAX_VISIBLE_MESSAGES = 50
+
+def render_message(message):
+    """Render a single chat message from history"""
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+
 def get_chat_history():
     """Get chat history"""
     start_index = max(
@@ -838,48 +944,15 @@ def get_chat_history():
     )
     return st.session_state.messages[start_index : len(st.session_state.messages) - 1]
 
-def create_prompt(user_question):
-    """Create prompt for the language model"""
-    # Get current bill statistics
-    bill_stats = get_bill_stats(session)
-    
-    if st.session_state.use_chat_history:
-        chat_history = get_chat_history()
-        if chat_history != []:
-            prompt_context, results = query_cortex_search_service(
-                user_question,
-                columns=["chunk", "source_file"],
-                filter={}
-            )
-        else:
-            prompt_context, results = query_cortex_search_service(
-                user_question,
-                columns=["chunk", "source_file"],
-                filter={}
-            )
-            chat_history = ""
-
-    # Process context to include bill links
-    processed_context = prompt_context
-    if results:
-        for result in results:
-            if 'SOURCE_FILE' in result:
-                bill_name = get_row_value(result, 'SOURCE_FILE')
-                if bill_name:
-                    bill_name = bill_name.replace('.pdf', '')
-                else:
-                    bill_name = 'Unknown Bill'
-                bill_ref = format_bill_reference(bill_name)
-                processed_context = processed_context.replace(bill_name, bill_ref)
-
-    prompt = f"""
+# Instructions for the language model, filled in per question by create_prompt
+PROMPT_TEMPLATE = """
             [INST]
             You are a helpful AI assistant specifically focused on Arkansas legislative bills filed for the 2025 session. 
             Your purpose is to help users understand and navigate these bills. You provide summaries of bills and information about the bill filing.
 
             Current Bill Statistics:
-            - Total Bills Filed: {bill_stats['total_bills']}
-            - Latest Filing Date: {bill_stats['latest_file_date']}
+            - Total Bills Filed: {total_bills}
+            - Latest Filing Date: {latest_file_date}
 
             IMPORTANT RESPONSE GUIDELINES:
             1. ONLY answer questions about Arkansas legislative bills for the 2025 session
@@ -918,7 +991,7 @@ def create_prompt(user_question):
             {chat_history}
             </chat_history>
             <context>
-            {processed_context}
+            {context}
             </context>
             <question>
             {user_question}
@@ -926,6 +999,51 @@ def create_prompt(user_question):
             [/INST]
             Answer:
             """
+
+def create_prompt(user_question):
+    """Create prompt for the language model"""
+    # Get current bill statistics
+    bill_stats = get_bill_stats(session)
+    
+    chat_history = ""
+    if st.session_state.use_chat_history:
+        chat_history = get_chat_history() or ""
+
+    prompt_context, results = query_cortex_search_service(
+        user_question,
+        columns=["CHUNK", "SOURCE_FILE"],
+        filter=None
+    )
+
+    # Process context to include bill links
+    processed_context = prompt_context
+    bill_names = set()
+    for result in results or []:
+        values = result.as_dict()
+        if 'SOURCE_FILE' in values:
+            bill_name = values['SOURCE_FILE']
+            if bill_name:
+                bill_name = bill_name.replace('.pdf', '')
+            else:
+                bill_name = 'Unknown Bill'
+            bill_names.add(bill_name)
+
+    if bill_names and processed_context:
+        # One pass over the context; longest names first so SB1 can't shadow SB10.
+        # Whole words only, and never inside an existing [SB1](url) link.
+        bill_refs = {name: format_bill_reference(name) for name in bill_names}
+        bill_pattern = re.compile(r'(?<!\[)\b(' + '|'.join(
+            re.escape(name) for name in sorted(bill_names, key=len, reverse=True)
+        ) + r')\b(?!\])')
+        processed_context = bill_pattern.sub(lambda m: bill_refs[m.group(1)], processed_context)
+
+    prompt = PROMPT_TEMPLATE.format(
+        total_bills=bill_stats['total_bills'],
+        latest_file_date=bill_stats['latest_file_date'],
+        chat_history=chat_history,
+        context=processed_context,
+        user_question=user_question
+    )
     return prompt, results
 
 def init_config_options():
@@ -1002,73 +1120,41 @@ def init_config_options():
 
 def init_main_container():
     """Initialize the main container with welcome message and styling"""
-    # Add custom CSS for modern styling
-    st.markdown("""
-        <style>
-        .main-header {
-            text-align: center;
-            padding: 1rem;
-            margin-bottom: 2rem;
-        }
-        .subheader {
-            text-align: center;
-            color: #666;
-            margin-bottom: 2rem;
-        }
-        .stats-container {
-            text-align: center;
-            padding: 1rem;
-            background-color: #f8f9fa;
-            border-radius: 10px;
-            margin-bottom: 2rem;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    # Get current statistics
+    stats = get_bill_stats(session)
     
-    # Main header with modern emojis
-    st.markdown("""
+    if stats['latest_file_date']:
+        latest_date = stats['latest_file_date'].strftime("%m/%d/%Y")
+    else:
+        latest_date = "N/A"
+    
+    # Header and stats in one HTML block; styles come from APP_CSS
+    st.markdown(f"""
         <div class="main-header">
             <h1>🏛️ AI Bill Brief</h1>
         </div>
         <div class="subheader">
             <h3>Your Intelligent Guide to Arkansas Legislative Bills ⚖️</h3>
         </div>
-    """, unsafe_allow_html=True)
-    
-    # Get current statistics
-    stats = get_bill_stats(session)
-    
-    # Display stats in a modern container
-    st.markdown("""
         <div class="stats-container">
             <h4>📊 Current Session Statistics</h4>
+            <div class="stats-grid">
+                <div>
+                    <div class="stat-label">📝 Total Bills</div>
+                    <div class="stat-value">{stats['total_bills']}</div>
+                </div>
+                <div>
+                    <div class="stat-label">📅 Session</div>
+                    <div class="stat-value">2025 Regular</div>
+                </div>
+                <div>
+                    <div class="stat-label">🔄 Last Updated</div>
+                    <div class="stat-value">{latest_date}</div>
+                </div>
+            </div>
+        </div>
     """, unsafe_allow_html=True)
     
-    # Create three columns for stats
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        st.metric(
-            "📝 Total Bills",
-            f"{stats['total_bills']}"
-        )
-    
-    with col2:
-        st.metric(
-            "📅 Session",
-            "2025 Regular"
-        )
-    
-    with col3:
-        if stats['latest_file_date']:
-            latest_date = stats['latest_file_date'].strftime("%m/%d/%Y")
-        else:
-            latest_date = "N/A"
-        st.metric(
-            "🔄 Last Updated",
-            latest_date
-        )
-    
     # Add a welcoming prompt
     st.markdown("""
         <div style="text-align: center; margin-top: 2rem; margin-bottom: 2rem;">
@@ -1134,67 +1220,29 @@ def load_bills_to_snowflake():
     try:
         print("Starting bill loading process...")
         
-        # Create processor
-        processor = LocalPDFProcessor('bills', 'csv_files')
+        # Create processor that writes chunks straight to Snowflake. The
+        # new rows are loaded into a staging table and swapped in only after
+        # every PDF has parsed and the load succeeded, so a failure leaves
+        # BILL_CHUNKS untouched.
+        processor = LocalPDFProcessor('bills', 'csv_files', snowflake_session=session)
         print("Created PDF processor")
         
         # Process PDFs
         print("Processing PDFs...")
         processor.process_pdfs()
         print("Finished processing PDFs")
-        
-        # Get list of CSV files
-        csv_files = [f for f in os.listdir('csv_files') if f.endswith('.csv')]
-        print(f"Found {len(csv_files)} CSV files: {csv_files}")
-        
-        # First, clear existing data
-        print("Clearing existing data from BILL_CHUNKS table...")
-        try:
-            session.sql("DELETE FROM BILL_CHUNKS").collect()
-            print("Successfully cleared existing data")
-        except Exception as e:
-            print(f"Error clearing data: {str(e)}")
-        
-        # Process each CSV file
-        for csv_file in csv_files:
-            try:
-                print(f"Processing {csv_file}...")
-                
-                # Read CSV file
-                df = pd.read_csv(f'csv_files/{csv_file}')
-                print(f"Read CSV file with {len(df)} rows")
-                
-                # Convert timestamp columns to proper format
-                if 'timestamp' in df.columns:
-                    df['timestamp'] = pd.to_datetime(df['timestamp'])
-                if 'date_filed' in df.columns:
-                    df['date_filed'] = pd.to_datetime(df['date_filed'])
-                
-                # Convert source_file to uppercase in pandas first
-                df['source_file'] = df['source_file'].str.upper()
-                
-                # Convert to Snowpark DataFrame
-                print(f"Writing {csv_file} to Snowflake...")
-                snow_df = session.create_dataframe(df)
-                snow_df.write.mode("append").save_as_table("BILL_CHUNKS")
-                print(f"Successfully wrote {csv_file} to Snowflake")
-                
-            except Exception as e:
-                print(f"Error processing {csv_file}: {str(e)}")
-                print(f"Error type: {type(e)}")
-                print(f"Traceback: {traceback.format_exc()}")
-                continue
                 
     except Exception as e:
         print(f"Error in load_bills_to_snowflake: {str(e)}")
         print(f"Error type: {type(e)}")
         print(f"Traceback: {traceback.format_exc()}")
+        raise
         
 def main():
     """Main function to run the Streamlit app"""
     # Initialize Snowflake session
     global session
-    session = get_snowflake_session()
+    session = get_live_session()
     
     if not session:
         print("❌ Failed to connect to the database. Please check your credentials and try again.")
@@ -1216,10 +1264,15 @@ def main():
     init_sidebar()
     init_main_container()
     
-    # Display chat messages from history on app rerun
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    # Display chat messages from history on app rerun; only the most
+    # recent ones are rendered up front, older ones wait in an expander
+    older_messages = st.session_state.messages[:-MAX_VISIBLE_MESSAGES]
+    if older_messages:
+        with st.expander(f"Show {len(older_messages)} earlier messages"):
+            for message in older_messages:
+                render_message(message)
+    for message in st.session_state.messages[-MAX_VISIBLE_MESSAGES:]:
+        render_message(message)
 
     # Create a container for the chat interface
     chat_container = st.container()
@@ -1229,9 +1282,11 @@ def main():
     
     # Debug information
     if st.session_state.debug:
-        st.sidebar.write("Debug Info:")
-        st.sidebar.write(f"Session Active: {session is not None}")
-        st.sidebar.write(f"Chat Disabled: {disable_chat}")
+        st.sidebar.code(
+            f"Debug Info:\n"
+            f"Session Active: {session is not None}\n"
+            f"Chat Disabled: {disable_chat}"
+        )
     
     if question := st.chat_input("Ask a question...", disabled=disable_chat):
         # Add user message to chat history
@@ -1248,14 +1303,26 @@ def main():
                 
                 # Show thinking animation
                 with st.spinner("Thinking..."):
+                    start = time.perf_counter()
                     prompt, results = create_prompt(question)
+                    retrieved = time.perf_counter()
                     generated_response = complete(
-                        prompt, session
+                        prompt, session, results=results
                     )
+                    completed = time.perf_counter()
                 
                 # Display the response
                 message_placeholder.markdown(generated_response)
                 
+                # Record where the time went for this answer
+                latency = {
+                    "retrieval": retrieved - start,
+                    "completion": completed - retrieved
+                }
+                st.session_state.chat_latency.append(latency)
+                if st.session_state.debug:
+                    st.sidebar.write("Latency (s):", {k: round(v, 3) for k, v in latency.items()})
+                
                 # Add to chat history
                 st.session_state.messages.append(
                     {"role": "assistant", "content": generated_response}
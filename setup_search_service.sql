@@ -3,16 +3,18 @@ USE ROLE ACCOUNTADMIN;
 USE DATABASE SNOW_PDF;
 USE SCHEMA PUBLIC;
 
--- Create a table to store the bill chunks with metadata
+-- Create a table to store the bill chunks with metadata.
+-- Column names are quoted lower-case, matching the loader's DataFrame
+-- columns and the app's queries (e.g. "source_file").
 CREATE OR REPLACE TABLE BILL_CHUNKS (
-    chunk TEXT,
-    chunk_index NUMBER,
-    source_file VARCHAR,
-    chunk_length NUMBER,
-    timestamp TIMESTAMP_NTZ,
-    date_filed TIMESTAMP_NTZ,
-    bill_subtitle TEXT,
-    bill_sponsor VARCHAR
+    "chunk" TEXT,
+    "chunk_index" NUMBER,
+    "source_file" VARCHAR,
+    "chunk_length" NUMBER,
+    "timestamp" TIMESTAMP_NTZ,
+    "date_filed" TIMESTAMP_NTZ,
+    "bill_subtitle" TEXT,
+    "bill_sponsor" VARCHAR
 );
 
 -- Create the Cortex Search Service with metadata fields